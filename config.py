@@ -21,6 +21,9 @@ class Settings:
     # 生产环境：使用自己部署的NIM
     NIM_EMBEDDING_URL = os.getenv('NIM_EMBEDDING_URL', 'http://embedding-nim.nim-service:8000/v1')
     
+    # 同时发往NIM的最大请求数
+    NIM_MAX_CONCURRENCY = int(os.getenv('NIM_MAX_CONCURRENCY', '64'))
+    
     # Embedding模型配置
     EMBEDDING_MODEL = "nvidia/llama-3.2-nv-embedqa-1b-v2"
     EMBEDDING_DIMENSION = 2048
@@ -79,6 +79,7 @@ def root():
             "search": "/api/search/semantic",
             "memories": "/api/search/memories",
             "chat": "/api/agent/chat",
+            "chat_stream": "/api/agent/chat/stream",
             "conversations": "/api/agent/conversations",
             "health": "/health",
             "docs": "/docs"
@@ -99,7 +100,7 @@ async def health_check():
     database_health = database_service.health_check()
     
     # 检查AI Agent服务
-    ai_agent_health = ai_agent_service.health_check()
+    ai_agent_health = await ai_agent_service.health_check()
     
     # 判断整体状态
     overall_status = "healthy" if (
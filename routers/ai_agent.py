@@ -1,5 +1,7 @@
 # AI Agent路由
+import json
 from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional, List
 from services.ai_agent_service import ai_agent_service
@@ -68,6 +70,41 @@ async def chat_with_agent(request: ChatRequest, current_user: User = Depends(get
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
+@router.post("/chat/stream")
+async def chat_with_agent_stream(request: ChatRequest, current_user: User = Depends(get_current_user)):
+    """
+    与AI Agent流式对话（Server-Sent Events）
+    
+    每个生成的文本片段作为一条 data 事件发送，生成结束后发送 event: done，
+    携带 conversation_id、context_used 和 timestamp。
+    
+    Example:
+        POST /api/agent/chat/stream
+        {
+            "message": "上周我们讨论了什么？",
+            "conversation_id": "conv_123",
+            "use_memory": true
+        }
+    """
+    async def event_stream():
+        try:
+            async for event in ai_agent_service.chat_with_memory_stream(
+                user_input=request.message,
+                user_id=current_user.id,
+                conversation_id=request.conversation_id,
+                use_memory=request.use_memory
+            ):
+                if event.get('done'):
+                    event.pop('done')
+                    yield f"event: done\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                else:
+                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            print(f"❌ Streaming chat failed: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @router.get("/conversations")
 async def get_all_conversations():
     """
@@ -158,4 +195,4 @@ async def list_conversations():
 @router.get("/health")
 async def agent_health_check():
     """检查AI Agent服务健康状态"""
-    return ai_agent_service.health_check()
+    return await ai_agent_service.health_check()
@@ -1,12 +1,16 @@
 # 上传路由
+import asyncio
 from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Depends
 from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from services.s3_service import s3_service
 from services.parser_service import parser_service
+from services.database_service import database_service
 from services.auth_service import auth_service
 from schemas import FileUploadResponse, User
 from typing import Optional
+from utils.memory_utils import generate_content_hash, make_dedup_key
 
 router = APIRouter(prefix="/api", tags=["upload"])
 
@@ -42,23 +46,59 @@ async def upload_file(
         JSON响应包含文件信息和记忆ID
     """
     try:
-        # 上传到S3
-        file_data = await s3_service.upload_file(file)
+        # 只读取一次文件内容，S3上传和解析共用这份数据
+        s3_service.validate_file(file)
+        file_content = await file.read()
         
         response_data = {
             "success": True,
-            "message": "File uploaded successfully",
-            "data": file_data
+            "message": "File uploaded successfully"
         }
         
+        # 相同文件已上传过时直接返回已有记忆和S3位置，不再重复上传
+        content_hash = None
+        if parse_and_store:
+            content_hash = make_dedup_key('file', generate_content_hash(file_content))
+            duplicate = parser_service.find_duplicate_file(file_content, current_user.id, content_hash)
+            if duplicate:
+                metadata = duplicate["parsed_content"]["metadata"]
+                response_data["message"] = "File already uploaded, reusing existing memory"
+                response_data["data"] = {
+                    "original_filename": metadata.get("original_filename"),
+                    "s3_key": metadata.get("s3_key"),
+                    "file_url": metadata.get("s3_url") or duplicate.get("source"),
+                    "file_size": metadata.get("file_size"),
+                    "file_extension": metadata.get("file_extension")
+                }
+                response_data["memory"] = {
+                    "memory_id": duplicate["memory_id"],
+                    "parsed_content": duplicate["parsed_content"],
+                    "embedding_dimension": duplicate["embedding_dimension"],
+                    "deduplicated": True
+                }
+                # DynamoDB中的数字为Decimal，需要转换后才能序列化
+                return JSONResponse(
+                    status_code=200,
+                    content=jsonable_encoder(response_data)
+                )
+        
+        # S3上传在后台进行，与解析并行
+        s3_task = asyncio.create_task(s3_service.upload_file(file, file_content))
+        
         # 如果启用解析，则解析文件并创建记忆
+        parse_result = None
         if parse_and_store:
             try:
-                parse_result = await parser_service.parse_file(file, file_data, current_user.id)
+                parse_result = await parser_service.parse_file(
+                    file, None, current_user.id,
+                    file_content=file_content,
+                    content_hash=content_hash
+                )
                 response_data["memory"] = {
                     "memory_id": parse_result["memory_id"],
                     "parsed_content": parse_result["parsed_content"],
-                    "embedding_dimension": parse_result["embedding_dimension"]
+                    "embedding_dimension": parse_result["embedding_dimension"],
+                    "deduplicated": parse_result.get("deduplicated", False)
                 }
                 response_data["message"] = "File uploaded and parsed successfully"
             except Exception as parse_error:
@@ -66,6 +106,28 @@ async def upload_file(
                 response_data["parse_error"] = str(parse_error)
                 response_data["message"] = "File uploaded but parsing failed"
         
+        # 等待S3上传完成
+        new_memory_ids = []
+        if parse_result and not parse_result.get("deduplicated"):
+            new_memory_ids = [parse_result["memory_id"]] + [
+                m["memory_id"] for m in parse_result.get("additional_memories", [])
+            ]
+            new_memory_ids = [memory_id for memory_id in new_memory_ids if memory_id]
+        
+        try:
+            file_data = await s3_task
+        except Exception:
+            # 上传失败时删除刚创建的记忆，避免记忆指向不存在的文件
+            for memory_id in new_memory_ids:
+                database_service.delete_memory(memory_id)
+            raise
+        
+        response_data["data"] = file_data
+        
+        # 把S3位置补写到新建的记忆中
+        for memory_id in new_memory_ids:
+            database_service.update_memory_source(memory_id, file_data)
+        
         return JSONResponse(
             status_code=200,
             content=response_data
@@ -100,13 +162,48 @@ async def upload_text(
                 "message": "Text uploaded and stored as memory",
                 "memory_id": parse_result["memory_id"],
                 "content": parse_result["content"],
-                "embedding_dimension": parse_result["embedding_dimension"]
+                "embedding_dimension": parse_result["embedding_dimension"],
+                "deduplicated": parse_result.get("deduplicated", False)
             }
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Text upload failed: {str(e)}")
 
+@router.api_route("/upload/hash/{content_hash}", methods=["GET", "HEAD"])
+async def check_content_hash(
+    content_hash: str,
+    kind: str = Query("file", description="内容类型：file（上传的文件）或 text（粘贴的文本）"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    检查当前用户是否已上传过相同内容
+    
+    Parameters:
+        content_hash: 内容的SHA-256（文件为原始字节，文本为UTF-8编码）
+        kind: 内容类型，文件和文本分别去重，相同字节的文本不会匹配文件
+    
+    Returns:
+        已存在时返回200和记忆ID，否则返回404；HEAD请求只返回状态码
+    """
+    if kind not in ("file", "text"):
+        raise HTTPException(status_code=400, detail="kind must be 'file' or 'text'")
+    
+    existing = database_service.find_memory_by_hash(
+        current_user.id, make_dedup_key(kind, content_hash.lower())
+    )
+    
+    if existing is None:
+        return JSONResponse(
+            status_code=404,
+            content={"exists": False}
+        )
+    
+    return {
+        "exists": True,
+        "memory_id": existing["id"]
+    }
+
 @router.get("/upload/supported-types")
 async def get_supported_types():
     """
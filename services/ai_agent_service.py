@@ -1,9 +1,11 @@
 # AI Agent服务
-from typing import List, Dict, Any, Optional
+import asyncio
+from collections import deque
+from typing import List, Dict, Any, Optional, AsyncIterator
 from datetime import datetime
 from services.database_service import database_service
 from services.embedding_service import embedding_service
-from services.llm_service import llm_service
+from services.llm_service import llm_service, HISTORY_TURNS, SUMMARY_THRESHOLD_CHARS, KEEP_RECENT_TURNS
 from utils.text_utils import clean_text, extract_keywords, generate_summary
 from utils.memory_utils import calculate_similarity
 import json
@@ -16,6 +18,10 @@ class AIAgentService:
     
     def __init__(self):
         self.conversation_history = {}  # 改为字典存储对话历史
+        # 对话摘要：conversation_id -> {'summary': 摘要, 'covered': 已并入摘要的累计轮数}
+        self.conversation_summaries = {}
+        self._turn_counts = {}  # 每个对话累计保存的轮数（历史列表会被截断，需单独计数）
+        self._summary_tasks = {}  # 后台进行中的摘要任务
         self.max_context_memories = 5
         self.similarity_threshold = 0.1  # 降低阈值以找到更多相关记忆
     
@@ -132,16 +138,11 @@ class AIAgentService:
     async def _generate_response(self, user_input: str, context: str, conversation_id: str = None) -> str:
         """生成AI响应（使用NVIDIA NIM LLM）"""
         try:
-            # 获取对话历史
-            conversation_history = []
-            if conversation_id and conversation_id in self.conversation_history:
-                conversation_history = self.conversation_history[conversation_id]
-            
             # 使用LLM生成响应
-            response = llm_service.generate_response(
+            response = await llm_service.generate_response(
                 user_input=user_input,
                 context=context,
-                conversation_history=conversation_history
+                conversation_history=self._get_recent_history(conversation_id)
             )
             
             return response
@@ -151,6 +152,123 @@ class AIAgentService:
             # 回退到简化响应
             return await self._fallback_response(user_input, context)
     
+    async def chat_with_memory_stream(
+        self,
+        user_input: str,
+        user_id: str,
+        conversation_id: str = None,
+        use_memory: bool = True
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        基于记忆的流式对话
+        
+        先逐段产出 {'delta': 文本片段}，生成结束后产出一次对话信息
+        {'done': True, 'conversation_id', 'context_used', 'timestamp'}
+        """
+        # 清理用户输入
+        cleaned_input = clean_text(user_input)
+        
+        # 如果启用记忆检索，搜索相关记忆
+        relevant_memories = []
+        if use_memory:
+            relevant_memories = await self._retrieve_relevant_memories(cleaned_input, user_id)
+        
+        # 构建上下文
+        context = self._build_context(relevant_memories, conversation_id)
+        
+        # 流式生成响应
+        response_parts = []
+        async for delta in llm_service.generate_response_stream(
+            user_input=cleaned_input,
+            context=context,
+            conversation_history=self._get_recent_history(conversation_id)
+        ):
+            response_parts.append(delta)
+            yield {'delta': delta}
+        
+        response = "".join(response_parts)
+        
+        # 保存对话历史
+        self._save_conversation_turn(user_input, response, conversation_id)
+        
+        # 如果响应中包含新信息，创建记忆
+        if self._should_create_memory(response):
+            await self._create_conversation_memory(user_input, response, user_id, conversation_id)
+        
+        yield {
+            'done': True,
+            'conversation_id': conversation_id or f"conv_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}",
+            'context_used': len(relevant_memories),
+            'timestamp': datetime.utcnow().isoformat()
+        }
+    
+    def _get_recent_history(self, conversation_id: str = None) -> deque:
+        """获取发送给LLM的最近对话历史（已有摘要时以摘要开头，后接尚未并入摘要的轮次）"""
+        conversation_history = deque(maxlen=HISTORY_TURNS)
+        if conversation_id and conversation_id in self.conversation_history:
+            turns = self._unsummarized_turns(conversation_id)
+            state = self.conversation_summaries.get(conversation_id)
+            if state:
+                conversation_history.append({'summary': state['summary']})
+                turns = turns[-(HISTORY_TURNS - 1):]
+            conversation_history.extend(turns)
+        return conversation_history
+    
+    def _unsummarized_turns(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """尚未并入摘要的对话轮次"""
+        state = self.conversation_summaries.get(conversation_id)
+        count = self._turn_counts.get(conversation_id, 0) - (state['covered'] if state else 0)
+        if count <= 0:
+            return []
+        return self.conversation_history.get(conversation_id, [])[-count:]
+    
+    def _schedule_summary(self, conversation_id: str):
+        """
+        历史即将超出窗口或过长时，在后台把较早的轮次并入摘要
+        
+        摘要不在请求路径上等待：本轮照常使用原始历史，摘要完成后从下一轮开始生效。
+        """
+        if conversation_id in self._summary_tasks:
+            return
+        
+        turns = self._unsummarized_turns(conversation_id)
+        if len(turns) <= KEEP_RECENT_TURNS:
+            return
+        
+        state = self.conversation_summaries.get(conversation_id)
+        slots = len(turns) + (1 if state else 0)
+        total_chars = sum(len(t.get('user_input', '')) + len(t.get('response', '')) for t in turns)
+        if slots <= HISTORY_TURNS and total_chars <= SUMMARY_THRESHOLD_CHARS:
+            return
+        
+        covered = self._turn_counts[conversation_id] - KEEP_RECENT_TURNS
+        task = asyncio.get_running_loop().create_task(self._fold_summary(
+            conversation_id,
+            turns[:-KEEP_RECENT_TURNS],
+            state['summary'] if state else None,
+            covered
+        ))
+        self._summary_tasks[conversation_id] = task
+        task.add_done_callback(lambda done: self._summary_task_done(conversation_id, done))
+    
+    def _summary_task_done(self, conversation_id: str, task: asyncio.Task):
+        """摘要任务结束后移除记录（对话被清除后可能已有新任务，不能误删）"""
+        if self._summary_tasks.get(conversation_id) is task:
+            del self._summary_tasks[conversation_id]
+    
+    async def _fold_summary(
+        self,
+        conversation_id: str,
+        turns: List[Dict[str, Any]],
+        previous_summary: Optional[str],
+        covered: int
+    ):
+        """把较早的轮次与已有摘要合并为新摘要"""
+        summary = await llm_service.summarize_turns(turns, previous_summary)
+        if summary is None or conversation_id not in self.conversation_history:
+            return
+        self.conversation_summaries[conversation_id] = {'summary': summary, 'covered': covered}
+    
     async def _fallback_response(self, user_input: str, context: str) -> str:
         """回退响应（当LLM不可用时）"""
         if context:
@@ -275,6 +393,9 @@ class AIAgentService:
         # 限制历史长度
         if len(self.conversation_history[conversation_id]) > 20:
             self.conversation_history[conversation_id] = self.conversation_history[conversation_id][-20:]
+        
+        self._turn_counts[conversation_id] = self._turn_counts.get(conversation_id, 0) + 1
+        self._schedule_summary(conversation_id)
     
     async def get_conversation_history(self, conversation_id: str) -> List[Dict[str, Any]]:
         """获取对话历史"""
@@ -285,12 +406,22 @@ class AIAgentService:
         if conversation_id:
             if conversation_id in self.conversation_history:
                 del self.conversation_history[conversation_id]
+            self.conversation_summaries.pop(conversation_id, None)
+            self._turn_counts.pop(conversation_id, None)
+            task = self._summary_tasks.pop(conversation_id, None)
+            if task:
+                task.cancel()
         else:
             self.conversation_history.clear()
+            self.conversation_summaries.clear()
+            self._turn_counts.clear()
+            for task in self._summary_tasks.values():
+                task.cancel()
+            self._summary_tasks.clear()
     
-    def health_check(self) -> Dict[str, Any]:
+    async def health_check(self) -> Dict[str, Any]:
         """健康检查"""
-        llm_health = llm_service.health_check()
+        llm_health = await llm_service.health_check()
         
         return {
             'status': 'healthy' if llm_health['status'] == 'healthy' else 'degraded',
@@ -1,5 +1,6 @@
 # 用户认证服务
 import uuid
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from passlib.context import CryptContext
@@ -17,8 +18,12 @@ class AuthService:
     """
     
     def __init__(self):
-        # 密码加密上下文
-        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        # 密码加密上下文（测试模式降低bcrypt轮数，生产保持默认的12轮）
+        self.pwd_context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__rounds=4 if settings.ENVIRONMENT == "test" else 12
+        )
         
         # 检查是否为测试模式
         if settings.ENVIRONMENT == "test":
@@ -114,10 +119,11 @@ class AuthService:
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None) -> str:
         """创建访问令牌"""
         to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.utcnow() + expires_delta
-        else:
-            expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        if not expires_delta:
+            expires_delta = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        
+        # exp直接使用POSIX整数秒，省去datetime构造和jose的转换
+        expire = int(time.time() + expires_delta.total_seconds())
         
         to_encode.update({"exp": expire, "type": "access"})
         encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
@@ -126,7 +132,7 @@ class AuthService:
     def create_refresh_token(self, data: dict) -> str:
         """创建刷新令牌"""
         to_encode = data.copy()
-        expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+        expire = int(time.time()) + settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
         to_encode.update({"exp": expire, "type": "refresh"})
         encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
         return encoded_jwt
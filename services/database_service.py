@@ -8,6 +8,7 @@ import boto3
 from botocore.exceptions import ClientError
 import numpy as np
 from schemas import MemoryUnit, SearchResult
+from utils.memory_utils import calculate_similarity_batch
 
 class DatabaseService:
     """
@@ -37,11 +38,18 @@ class DatabaseService:
         
         # 初始化表
         self.dynamodb_disabled = False
+        # content_hash_index 可用后才进行哈希去重查询；旧表上补建索引期间为 pending
+        self._content_hash_index_ready = False
+        self._content_hash_index_pending = False
+        self._content_hash_index_checked_at = 0.0
         self._init_tables()
         
         # 内存中的向量存储（用于快速搜索）
         self.vector_store = {}
         
+        # 按用户缓存的 SoA 布局 (memory_ids, 向量矩阵, 范数)，向量增删时失效
+        self._user_vectors_cache = {}
+        
         # 从DynamoDB加载现有向量到内存
         self._load_vectors_to_memory()
     
@@ -50,8 +58,10 @@ class DatabaseService:
         try:
             # 检查表是否存在
             try:
-                self.dynamodb.Table(self.memories_table_name).load()
+                memories_table = self.dynamodb.Table(self.memories_table_name)
+                memories_table.load()
                 print(f"📋 Table already exists: {self.memories_table_name}")
+                self._ensure_content_hash_index(memories_table)
             except ClientError as e:
                 if e.response['Error']['Code'] == 'ResourceNotFoundException':
                     # 表不存在，尝试创建
@@ -64,7 +74,9 @@ class DatabaseService:
                         AttributeDefinitions=[
                             {'AttributeName': 'id', 'AttributeType': 'S'},
                             {'AttributeName': 'created_at', 'AttributeType': 'S'},
-                            {'AttributeName': 'memory_type', 'AttributeType': 'S'}
+                            {'AttributeName': 'memory_type', 'AttributeType': 'S'},
+                            {'AttributeName': 'content_hash', 'AttributeType': 'S'},
+                            {'AttributeName': 'user_id', 'AttributeType': 'S'}
                         ],
                         GlobalSecondaryIndexes=[
                             {
@@ -81,10 +93,19 @@ class DatabaseService:
                                     {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
                                 ],
                                 'Projection': {'ProjectionType': 'ALL'}
+                            },
+                            {
+                                'IndexName': 'content_hash_index',
+                                'KeySchema': [
+                                    {'AttributeName': 'content_hash', 'KeyType': 'HASH'},
+                                    {'AttributeName': 'user_id', 'KeyType': 'RANGE'}
+                                ],
+                                'Projection': {'ProjectionType': 'ALL'}
                             }
                         ],
                         BillingMode='PAY_PER_REQUEST'
                     )
+                    self._content_hash_index_ready = True
                     print(f"✅ Table created: {self.memories_table_name}")
                 else:
                     print(f"❌ Error checking table {self.memories_table_name}: {e}")
@@ -125,6 +146,73 @@ class DatabaseService:
                 print(f"❌ Error with tables: {e}")
                 raise
     
+    def _ensure_content_hash_index(self, memories_table):
+        """已存在的记忆表缺少 content_hash_index 时补建（旧部署升级时表不会重建）"""
+        for index in memories_table.global_secondary_indexes or []:
+            if index['IndexName'] == 'content_hash_index':
+                if index.get('IndexStatus') == 'ACTIVE':
+                    self._content_hash_index_ready = True
+                else:
+                    self._content_hash_index_pending = True
+                    print("⏳ content_hash_index is still being built, dedup disabled until it is active")
+                return
+        
+        try:
+            print(f"🔨 Adding content_hash_index to {self.memories_table_name}")
+            self.dynamodb.meta.client.update_table(
+                TableName=self.memories_table_name,
+                AttributeDefinitions=[
+                    {'AttributeName': 'content_hash', 'AttributeType': 'S'},
+                    {'AttributeName': 'user_id', 'AttributeType': 'S'}
+                ],
+                GlobalSecondaryIndexUpdates=[
+                    {
+                        'Create': {
+                            'IndexName': 'content_hash_index',
+                            'KeySchema': [
+                                {'AttributeName': 'content_hash', 'KeyType': 'HASH'},
+                                {'AttributeName': 'user_id', 'KeyType': 'RANGE'}
+                            ],
+                            'Projection': {'ProjectionType': 'ALL'}
+                        }
+                    }
+                ]
+            )
+            self._content_hash_index_pending = True
+            print("⏳ content_hash_index is being built, dedup disabled until it is active")
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('ResourceInUseException', 'LimitExceededException'):
+                # 其他worker已在补建索引（或表正在更新），稍后重新检查状态
+                self._content_hash_index_pending = True
+                print(f"⏳ content_hash_index update already in progress, will re-check: {e}")
+            else:
+                print(f"⚠️  Failed to add content_hash_index, dedup disabled: {e}")
+    
+    def _content_hash_index_available(self) -> bool:
+        """content_hash_index 是否可查询；补建中时每分钟最多重新检查一次状态"""
+        if self._content_hash_index_ready:
+            return True
+        if not self._content_hash_index_pending:
+            return False
+        
+        import time
+        now = time.time()
+        if now - self._content_hash_index_checked_at < 60:
+            return False
+        self._content_hash_index_checked_at = now
+        
+        try:
+            description = self.dynamodb.meta.client.describe_table(TableName=self.memories_table_name)
+            for index in description['Table'].get('GlobalSecondaryIndexes', []):
+                if index['IndexName'] == 'content_hash_index' and index.get('IndexStatus') == 'ACTIVE':
+                    self._content_hash_index_ready = True
+                    self._content_hash_index_pending = False
+                    print("✅ content_hash_index is active, dedup enabled")
+        except ClientError as e:
+            print(f"⚠️  Failed to check content_hash_index status: {e}")
+        
+        return self._content_hash_index_ready
+    
     def _load_vectors_to_memory(self):
         """从DynamoDB加载向量到内存"""
         if self.dynamodb_disabled:
@@ -145,11 +233,9 @@ class DatabaseService:
                 
                 # 存储到内存向量存储
                 # ✅ 修复：添加user_id
-                self.vector_store[memory_id] = {
-                    'embedding': np.array(float_embedding),
-                    'memory_id': memory_id,
-                    'user_id': item.get('user_id')  # ✅ 添加这行！
-                }
+                self.vector_store[memory_id] = self._make_vector_entry(
+                    memory_id, float_embedding, item.get('user_id')  # ✅ 添加这行！
+                )
                 loaded_count += 1
             
             print(f"✅ Loaded {loaded_count} vectors from DynamoDB to memory")
@@ -158,6 +244,37 @@ class DatabaseService:
             print(f"⚠️  Failed to load vectors from DynamoDB: {e}")
             # 不抛出异常，允许系统继续运行
     
+    @staticmethod
+    def _make_vector_entry(memory_id: str, embedding, user_id: Optional[str]) -> Dict[str, Any]:
+        """构造内存向量条目，范数在写入时计算一次"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        return {
+            'embedding': vector,
+            'norm': float(np.linalg.norm(vector)),
+            'memory_id': memory_id,
+            'user_id': user_id
+        }
+    
+    def _get_user_vectors(self, user_id: str):
+        """获取用户的 (memory_ids, 向量矩阵, 范数)，首次访问时构建并缓存"""
+        cached = self._user_vectors_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
+        memory_ids = [
+            memory_id for memory_id, vector_data in self.vector_store.items()
+            if vector_data.get('user_id') == user_id
+        ]
+        if memory_ids:
+            matrix = np.stack([self.vector_store[memory_id]['embedding'] for memory_id in memory_ids])
+            norms = np.array([self.vector_store[memory_id]['norm'] for memory_id in memory_ids], dtype=np.float32)
+        else:
+            matrix = norms = None
+        
+        cached = (memory_ids, matrix, norms)
+        self._user_vectors_cache[user_id] = cached
+        return cached
+    
     def create_memory(
         self,
         content: str,
@@ -167,7 +284,8 @@ class DatabaseService:
         metadata: Dict[str, Any] = None,
         source: str = None,
         summary: str = None,
-        tags: List[str] = None
+        tags: List[str] = None,
+        content_hash: str = None
     ) -> str:
         """
         创建新的记忆单元
@@ -181,6 +299,7 @@ class DatabaseService:
             source: 来源
             summary: 摘要
             tags: 标签
+            content_hash: 原始内容的SHA-256，用于去重
             
         Returns:
             str: 记忆ID
@@ -206,6 +325,10 @@ class DatabaseService:
             'tags': tags or []
         }
         
+        # content_hash是索引键，没有时不写入（DynamoDB稀疏索引）
+        if content_hash:
+            memory_data['content_hash'] = content_hash
+        
         # 准备向量数据 - 将浮点数转换为Decimal
         from decimal import Decimal
         
@@ -231,11 +354,8 @@ class DatabaseService:
             vectors_table.put_item(Item=vector_data)
             
             # 同时存储到内存（用于快速搜索）
-            self.vector_store[memory_id] = {
-                'embedding': np.array(embedding),
-                'memory_id': memory_id,
-                'user_id': user_id  # ✅ 添加这行
-            }
+            self.vector_store[memory_id] = self._make_vector_entry(memory_id, embedding, user_id)
+            self._user_vectors_cache.pop(user_id, None)
             
             print(f"✅ Memory created: {memory_id}")
             print(f"✅ Vector stored: {len(embedding)} dimensions")
@@ -267,24 +387,19 @@ class DatabaseService:
         import time
         start_time = time.time()
         
-        query_vector = np.array(query_embedding)
         results = []
         
         # 计算相似度（使用余弦相似度）
         print(f"🔍 Searching in {len(self.vector_store)} vectors with threshold {threshold} for user {user_id}")
         
-        for memory_id, vector_data in self.vector_store.items():
-            # 检查是否属于当前用户
-            if vector_data.get('user_id') != user_id:
-                continue
-                
-            embedding = vector_data['embedding']
-            
-            # 计算余弦相似度
-            similarity = np.dot(query_vector, embedding) / (
-                np.linalg.norm(query_vector) * np.linalg.norm(embedding)
-            )
-            
+        # 只取当前用户的向量（缓存的矩阵和预计算范数），一次批量计算全部相似度
+        memory_ids, matrix, norms = self._get_user_vectors(user_id)
+        if not memory_ids:
+            return []
+        
+        similarities = calculate_similarity_batch(query_embedding, matrix, norms)
+        
+        for memory_id, similarity in zip(memory_ids, similarities):
             print(f"📊 Memory {memory_id[:8]}... similarity: {similarity:.4f}")
             
             if similarity >= threshold:
@@ -322,6 +437,52 @@ class DatabaseService:
             print(f"❌ Failed to get memory {memory_id}: {e}")
             return None
     
+    def update_memory_source(self, memory_id: str, s3_data: Dict[str, Any]) -> bool:
+        """补写记忆的S3来源信息"""
+        if self.dynamodb_disabled:
+            return False
+            
+        try:
+            table = self.dynamodb.Table(self.memories_table_name)
+            table.update_item(
+                Key={'id': memory_id},
+                UpdateExpression='SET #source = :url, metadata.s3_key = :key, metadata.s3_url = :url',
+                ExpressionAttributeNames={'#source': 'source'},
+                ExpressionAttributeValues={
+                    ':key': s3_data.get('s3_key'),
+                    ':url': s3_data.get('file_url')
+                }
+            )
+            return True
+            
+        except Exception as e:
+            print(f"❌ Failed to update source for memory {memory_id}: {e}")
+            return False
+    
+    def find_memory_by_hash(self, user_id: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        """根据内容哈希查找用户已有的记忆"""
+        if self.dynamodb_disabled or not self._content_hash_index_available():
+            return None
+            
+        try:
+            table = self.dynamodb.Table(self.memories_table_name)
+            response = table.query(
+                IndexName='content_hash_index',
+                KeyConditionExpression='content_hash = :hash AND user_id = :user_id',
+                ExpressionAttributeValues={
+                    ':hash': content_hash,
+                    ':user_id': user_id
+                },
+                Limit=1
+            )
+            
+            items = response.get('Items', [])
+            return items[0] if items else None
+            
+        except Exception as e:
+            print(f"⚠️  Failed to look up memory by hash: {e}")
+            return None
+    
     def get_memories(
         self,
         user_id: str,
@@ -434,7 +595,8 @@ class DatabaseService:
             
             # 从内存向量存储删除
             if memory_id in self.vector_store:
-                del self.vector_store[memory_id]
+                vector_data = self.vector_store.pop(memory_id)
+                self._user_vectors_cache.pop(vector_data.get('user_id'), None)
             
             print(f"✅ Memory deleted: {memory_id}")
             print(f"✅ Vector deleted: {memory_id}")
@@ -1,10 +1,105 @@
 # LLM服务
+import asyncio
+import re
 import requests
 import json
-from typing import Dict, Any, List
-from openai import OpenAI
+import httpx
+from collections import deque
+from typing import Dict, Any, List, Iterable, Optional, AsyncIterator
+from openai import AsyncOpenAI
 from config import settings
 
+# 系统提示的固定部分在模块加载时构建一次，只有上下文部分需要每次格式化
+_BASE_PROMPT = """你是一个智能的个人记忆助手，名为UniMem AI。你的主要功能是：
+
+        ##  核心任务
+        直接使用提供的记忆信息回答用户问题，不要反问用户！
+
+        ## ✅ 正确的回答方式
+        当用户问："Gregory 的课程是关于什么的？"
+        如果记忆中有信息，直接回答：
+        "Gregory 教授的课程是关于时间序列分析、面板数据和预测方法！具体包括 Class #3 和 Class #4，涵盖了时间序列数据的统计分析和预测技术。"
+
+        ## ❌ 错误的回答方式
+        不要说：
+        - "根据提供的信息..."（太生硬）
+        - "请告诉我更多关于..."（不要反问）
+        - "我需要确认一下..."（不要质疑记忆）
+        - "Gregory 的课程大概是关于..."（不要模糊）
+
+        ## 📋 回答原则
+        1. **直接回答**: 如果记忆中有信息，直接、清晰地回答
+        2. **自信表达**: 使用肯定的语气，不要说"可能"、"大概"
+        3. **具体详细**: 使用记忆中的具体细节
+        4. **自然对话**: 像朋友一样交流，适当使用 emoji 😊
+        5. **承认不知道**: 只有记忆中真的没有信息时才说不知道
+
+        ## 🔑 关键指示
+        - 优先使用下面提供的"当前记忆信息"
+        - 记忆信息就是事实，不要质疑它
+        - 不要让用户重复已经在记忆中的信息
+
+        """
+
+_PROMPT_WITH_CTX = _BASE_PROMPT + """
+
+    ## 📚 当前记忆信息
+    以下是系统为你找到的相关记忆，请直接使用这些信息回答用户的问题：
+
+    {context}
+
+    **重要提示**: 以上记忆信息就是你应该使用的事实依据。请直接、自信地使用这些信息回答用户，不要反问用户已经在记忆中的内容！
+    """
+
+_PROMPT_NO_CTX = _BASE_PROMPT + """
+
+    ## ⚠️ 注意
+    目前没有找到相关的记忆信息。请礼貌地告诉用户你还没有相关记忆，并询问是否需要了解其他信息。
+    """
+
+# 简化响应的意图关键词，按优先级排列（与原if/elif顺序一致）
+_SIMPLE_INTENTS = [
+    # 问候语
+    (["你好", "hello", "hi", "您好"],
+     "你好！我是UniMem AI助手，可以帮助您管理和检索个人记忆。有什么我可以帮助您的吗？"),
+    # 关于JavaScript的问题
+    (["javascript", "js", "前端", "编程"],
+     "关于JavaScript，我可以帮您搜索相关的技术文档和记忆。JavaScript是一种广泛使用的编程语言，主要用于网页开发。"),
+    # 关于React的问题
+    (["react", "框架", "组件"],
+     "React是一个用于构建用户界面的JavaScript库。它使用组件化开发模式，提高了代码的可维护性和复用性。"),
+    # 搜索相关
+    (["搜索", "查找", "找", "search", "find"],
+     "我可以帮您搜索相关的记忆和文档。请告诉我您想了解什么内容，我会在您的记忆中查找相关信息。"),
+]
+
+# 关键词 -> 意图序号；所有关键词编译成一个正则，一次扫描完成匹配
+_INTENT_BY_KEYWORD = {}
+for _intent, (_keywords, _) in enumerate(_SIMPLE_INTENTS):
+    for _keyword in _keywords:
+        _INTENT_BY_KEYWORD.setdefault(_keyword, _intent)
+
+# 零宽前瞻使重叠的关键词也能被匹配到
+_INTENT_RE = re.compile(
+    "(?=(" + "|".join(re.escape(k) for k in sorted(_INTENT_BY_KEYWORD, key=len, reverse=True)) + "))"
+)
+
+def _match_intent(text: str) -> int:
+    """返回文本命中的最高优先级意图序号，未命中返回-1"""
+    best = -1
+    for match in _INTENT_RE.finditer(text):
+        intent = _INTENT_BY_KEYWORD[match.group(1)]
+        if intent == 0:
+            return 0
+        if best < 0 or intent < best:
+            best = intent
+    return best
+
+# 对话历史配置
+HISTORY_TURNS = 6  # 发送给LLM的最近对话轮数
+SUMMARY_THRESHOLD_CHARS = 2000  # 历史超过该字符数时压缩较早的轮次
+KEEP_RECENT_TURNS = 2  # 压缩时原样保留的最近轮数
+
 class LLMService:
     """
     LLM服务 - 使用NVIDIA NIM进行文本生成
@@ -21,17 +116,29 @@ class LLMService:
             self.base_url = settings.NVIDIA_API_BASE_URL
             print(f"🔧 Using development API: {self.base_url}")
         
-        self.client = OpenAI(
+        # 共享连接池的异步HTTP客户端，复用TCP/TLS连接
+        # 传入transport时AsyncClient会忽略自身的limits/http2参数，所以都配置在transport上
+        self.http_client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                retries=2,
+                http2=True,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+            )
+        )
+        self.client = AsyncOpenAI(
             base_url=self.base_url,
-            api_key=self.api_key
+            api_key=self.api_key,
+            http_client=self.http_client
         )
+        # 限制同时发往NIM的请求数，避免触发服务端并发上限
+        self.semaphore = asyncio.Semaphore(settings.NIM_MAX_CONCURRENCY)
         self.model = "nvidia/llama-3.1-nemotron-nano-8b-v1"  # ✅ 比赛要求
         
-    def generate_response(
+    async def generate_response(
         self,
         user_input: str,
         context: str = "",
-        conversation_history: List[Dict[str, str]] = None
+        conversation_history: Iterable[Dict[str, str]] = None
     ) -> str:
         """
         生成AI响应
@@ -39,29 +146,16 @@ class LLMService:
         Args:
             user_input: 用户输入
             context: 上下文信息
-            conversation_history: 对话历史
+            conversation_history: 对话历史，通常是 deque(maxlen=HISTORY_TURNS)
             
         Returns:
             str: AI响应
         """
         try:
-            # 构建系统提示
-            system_prompt = self._build_system_prompt(context)
-            
-            # 构建消息
-            messages = [{"role": "system", "content": system_prompt}]
-            
-            # 添加对话历史
-            if conversation_history:
-                for turn in conversation_history[-6:]:  # 最近6轮对话
-                    messages.append({"role": "user", "content": turn.get("user_input", "")})
-                    messages.append({"role": "assistant", "content": turn.get("response", "")})
-            
-            # 添加当前用户输入
-            messages.append({"role": "user", "content": user_input})
+            messages = self._build_messages(user_input, context, conversation_history)
             
             # 调用NVIDIA NIM API
-            response = self._call_nvidia_api(messages)
+            response = await self._call_nvidia_api(messages)
             
             return response
             
@@ -69,72 +163,127 @@ class LLMService:
             print(f"❌ LLM generation failed: {e}")
             return "抱歉，我遇到了一些技术问题，请稍后再试。"
     
-    def _build_system_prompt(self, context: str) -> str:
-        """构建系统提示"""
-        base_prompt = """你是一个智能的个人记忆助手，名为UniMem AI。你的主要功能是：
-
-        ##  核心任务
-        直接使用提供的记忆信息回答用户问题，不要反问用户！
-
-        ## ✅ 正确的回答方式
-        当用户问："Gregory 的课程是关于什么的？"
-        如果记忆中有信息，直接回答：
-        "Gregory 教授的课程是关于时间序列分析、面板数据和预测方法！具体包括 Class #3 和 Class #4，涵盖了时间序列数据的统计分析和预测技术。"
-
-        ## ❌ 错误的回答方式
-        不要说：
-        - "根据提供的信息..."（太生硬）
-        - "请告诉我更多关于..."（不要反问）
-        - "我需要确认一下..."（不要质疑记忆）
-        - "Gregory 的课程大概是关于..."（不要模糊）
-
-        ## 📋 回答原则
-        1. **直接回答**: 如果记忆中有信息，直接、清晰地回答
-        2. **自信表达**: 使用肯定的语气，不要说"可能"、"大概"
-        3. **具体详细**: 使用记忆中的具体细节
-        4. **自然对话**: 像朋友一样交流，适当使用 emoji 😊
-        5. **承认不知道**: 只有记忆中真的没有信息时才说不知道
-
-        ## 🔑 关键指示
-        - 优先使用下面提供的"当前记忆信息"
-        - 记忆信息就是事实，不要质疑它
-        - 不要让用户重复已经在记忆中的信息
-
+    async def generate_response_stream(
+        self,
+        user_input: str,
+        context: str = "",
+        conversation_history: Iterable[Dict[str, str]] = None
+    ) -> AsyncIterator[str]:
         """
-
-        if context:
-            # 有上下文 - 强调使用这些信息
-            base_prompt += f"""
-
-    ## 📚 当前记忆信息
-    以下是系统为你找到的相关记忆，请直接使用这些信息回答用户的问题：
-
-    {context}
-
-    **重要提示**: 以上记忆信息就是你应该使用的事实依据。请直接、自信地使用这些信息回答用户，不要反问用户已经在记忆中的内容！
-    """
-        else:
-            # 没有上下文 - 礼貌告知
-            base_prompt += """
-
-    ## ⚠️ 注意
-    目前没有找到相关的记忆信息。请礼貌地告诉用户你还没有相关记忆，并询问是否需要了解其他信息。
-    """
+        流式生成AI响应，逐段产出生成的文本
         
-        return base_prompt
+        Args:
+            user_input: 用户输入
+            context: 上下文信息
+            conversation_history: 对话历史，通常是 deque(maxlen=HISTORY_TURNS)
+            
+        Yields:
+            str: 响应文本片段
+        """
+        messages = [{"role": "user", "content": user_input}]
+        produced = False
         
-
+        try:
+            messages = self._build_messages(user_input, context, conversation_history)
+            
+            async with self.semaphore:
+                stream = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=1000,
+                    temperature=0.7,
+                    stream=True
+                )
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        produced = True
+                        yield delta
+            
+        except Exception as e:
+            print(f"❌ NVIDIA NIM streaming failed: {e}")
+            # 还没有输出任何内容时，回退到简化响应
+            if not produced:
+                yield self._generate_simple_response(messages)
+    
+    def _build_messages(
+        self,
+        user_input: str,
+        context: str,
+        conversation_history: Optional[Iterable[Dict[str, str]]]
+    ) -> List[Dict[str, str]]:
+        """构建发送给LLM的消息列表"""
+        # 构建系统提示
+        system_prompt = self._build_system_prompt(context)
+        
+        # 构建消息
+        messages = [{"role": "system", "content": system_prompt}]
+        
+        # 添加对话历史（最近6轮，可以以 {"summary": ...} 开头表示更早轮次的摘要）
+        if conversation_history:
+            if not isinstance(conversation_history, deque) or conversation_history.maxlen != HISTORY_TURNS:
+                conversation_history = deque(conversation_history, maxlen=HISTORY_TURNS)
+            
+            for turn in conversation_history:
+                if "summary" in turn:
+                    messages.append({"role": "system", "content": f"之前对话的摘要：{turn['summary']}"})
+                    continue
+                messages.append({"role": "user", "content": turn.get("user_input", "")})
+                messages.append({"role": "assistant", "content": turn.get("response", "")})
+        
+        # 添加当前用户输入
+        messages.append({"role": "user", "content": user_input})
+        
+        return messages
     
-    def _call_nvidia_api(self, messages: List[Dict[str, str]]) -> str:
+    async def summarize_turns(
+        self,
+        turns: List[Dict[str, str]],
+        previous_summary: Optional[str] = None
+    ) -> Optional[str]:
+        """将若干对话轮次（连同已有摘要）合并为一条新摘要，失败时返回None"""
+        transcript = "\n".join(
+            f"用户: {t.get('user_input', '')}\n助手: {t.get('response', '')}" for t in turns
+        )
+        if previous_summary:
+            transcript = f"已有摘要：{previous_summary}\n\n后续对话：\n{transcript}"
+        return await self._summarize(transcript)
+    
+    async def _summarize(self, transcript: str) -> Optional[str]:
+        """调用LLM生成对话摘要，失败时返回None"""
+        try:
+            async with self.semaphore:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": "请用简洁的中文总结以下对话的要点，保留关键事实和用户的需求。"},
+                        {"role": "user", "content": transcript}
+                    ],
+                    max_tokens=300,
+                    temperature=0.3
+                )
+            return response.choices[0].message.content.strip()
+            
+        except Exception as e:
+            print(f"⚠️  Conversation summary failed: {e}")
+            return None
+    
+    def _build_system_prompt(self, context: str) -> str:
+        """构建系统提示"""
+        # 有上下文 - 强调使用这些信息；没有上下文 - 礼貌告知
+        return _PROMPT_WITH_CTX.format(context=context) if context else _PROMPT_NO_CTX
+    
+    async def _call_nvidia_api(self, messages: List[Dict[str, str]]) -> str:
         """调用NVIDIA NIM API"""
         try:
             # 尝试使用chat completions
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=1000,
-                temperature=0.7
-            )
+            async with self.semaphore:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=1000,
+                    temperature=0.7
+                )
             
             return response.choices[0].message.content.strip()
             
@@ -154,38 +303,23 @@ class LLMService:
                     break
             
             # 基于用户输入生成简单响应
-            user_input_lower = user_message.lower()
-            
-            # 问候语
-            if any(word in user_input_lower for word in ["你好", "hello", "hi", "您好"]):
-                return "你好！我是UniMem AI助手，可以帮助您管理和检索个人记忆。有什么我可以帮助您的吗？"
-            
-            # 关于JavaScript的问题
-            elif any(word in user_input_lower for word in ["javascript", "js", "前端", "编程"]):
-                return "关于JavaScript，我可以帮您搜索相关的技术文档和记忆。JavaScript是一种广泛使用的编程语言，主要用于网页开发。"
-            
-            # 关于React的问题
-            elif any(word in user_input_lower for word in ["react", "框架", "组件"]):
-                return "React是一个用于构建用户界面的JavaScript库。它使用组件化开发模式，提高了代码的可维护性和复用性。"
-            
-            # 搜索相关
-            elif any(word in user_input_lower for word in ["搜索", "查找", "找", "search", "find"]):
-                return "我可以帮您搜索相关的记忆和文档。请告诉我您想了解什么内容，我会在您的记忆中查找相关信息。"
+            intent = _match_intent(user_message.lower())
+            if intent >= 0:
+                return _SIMPLE_INTENTS[intent][1]
             
             # 默认响应
-            else:
-                return f"我理解您的问题：'{user_message}'。虽然我目前无法使用高级AI功能，但我可以帮您搜索相关的记忆和文档。请告诉我您想了解什么具体内容。"
+            return f"我理解您的问题：'{user_message}'。虽然我目前无法使用高级AI功能，但我可以帮您搜索相关的记忆和文档。请告诉我您想了解什么具体内容。"
                 
         except Exception as e:
             print(f"❌ Simple response generation failed: {e}")
             return "抱歉，我遇到了一些技术问题，请稍后再试。"
     
-    def health_check(self) -> Dict[str, Any]:
+    async def health_check(self) -> Dict[str, Any]:
         """健康检查"""
         try:
             # 测试API连接
             test_messages = [{"role": "user", "content": "Hello"}]
-            self._call_nvidia_api(test_messages)
+            await self._call_nvidia_api(test_messages)
             
             return {
                 "status": "healthy",
@@ -2,17 +2,58 @@
 import os
 import io
 import base64
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Dict, Any, Optional, List
 from fastapi import UploadFile, HTTPException
-import PyPDF2
-import docx
-from PIL import Image
-import pytesseract
-from pdf2image import convert_from_bytes
 import requests
 from config import settings
 from services.embedding_service import embedding_service
 from services.database_service import database_service
+from utils.memory_utils import generate_content_hash, make_dedup_key
+
+OCR_LANG = 'chi_sim+eng'
+TEXT_ENCODINGS = ('utf-8', 'gbk', 'latin-1')  # latin-1 可解码任意字节，作为最终回退
+MIN_PAGE_TEXT_LENGTH = 20  # 少于该长度的页面视为扫描页，需要OCR
+OCR_RENDER_DPI = 200  # 扫描页渲染分辨率，与原pdf2image默认值一致，保证小号中文字形的识别率
+
+# OCR线程池，每个线程持有自己的Tesseract实例
+_OCR_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='ocr')
+_TESS_API_LOCAL = threading.local()
+
+# PDF、DOCX、图片和OCR相关的库较重，只在第一次用到时导入
+@lru_cache(maxsize=None)
+def _get_tesserocr():
+    """
+    tesserocr直接绑定libtesseract，可在进程内复用已加载的语言数据；
+    不可用时返回None，回退到pytesseract。结果缓存，避免每页重复尝试导入。
+    """
+    try:
+        import tesserocr
+        return tesserocr
+    except ImportError:
+        return None
+
+def _get_tess_api():
+    """获取当前线程的Tesseract实例（首次使用时创建）"""
+    api = getattr(_TESS_API_LOCAL, 'api', None)
+    if api is None:
+        tesserocr = _get_tesserocr()
+        api = tesserocr.PyTessBaseAPI(lang=OCR_LANG, psm=tesserocr.PSM.AUTO)
+        _TESS_API_LOCAL.api = api
+    return api
+
+def _ocr_page(image) -> str:
+    """识别单页图片中的文本"""
+    if _get_tesserocr() is None:
+        import pytesseract
+        return pytesseract.image_to_string(image, lang=OCR_LANG)
+    
+    api = _get_tess_api()
+    api.SetImage(image)
+    return api.GetUTF8Text()
 
 class ParserService:
     """
@@ -103,14 +144,23 @@ class ParserService:
         
         return chunks
     
-    async def parse_file(self, file: UploadFile, s3_data: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    async def parse_file(
+        self,
+        file: UploadFile,
+        s3_data: Optional[Dict[str, Any]],
+        user_id: str,
+        file_content: bytes = None,
+        content_hash: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         解析上传的文件并创建记忆单元
         
         Args:
             file: 上传的文件
-            s3_data: S3上传返回的数据
+            s3_data: S3上传返回的数据，上传与解析并行时为None，之后再补写
             user_id: 用户ID
+            file_content: 已读取的文件内容，为空时从file读取
+            content_hash: 调用方已计算并完成去重查询的去重键，传入时不再重复哈希和查询
             
         Returns:
             Dict: 解析结果和记忆ID
@@ -124,9 +174,19 @@ class ParserService:
                     detail=f"Unsupported file type: {file_extension}"
                 )
             
-            # 重置文件指针
-            await file.seek(0)
-            file_content = await file.read()
+            s3_data = s3_data or {}
+            
+            if file_content is None:
+                # 重置文件指针
+                await file.seek(0)
+                file_content = await file.read()
+            
+            # 相同内容已经入库时直接返回已有记忆，跳过解析和embedding
+            if content_hash is None:
+                content_hash = make_dedup_key('file', generate_content_hash(file_content))
+                duplicate = self.find_duplicate_file(file_content, user_id, content_hash)
+                if duplicate:
+                    return duplicate
             
             # 根据文件类型解析
             parser_func = self.supported_types[file_extension]
@@ -138,27 +198,32 @@ class ParserService:
                 input_type="passage"
             )
             
+            # 所有记忆单元共用的元数据，只构建一次
+            base_metadata = {
+                'original_filename': file.filename,
+                'file_size': len(file_content),
+                'file_extension': file_extension,
+                's3_key': s3_data.get('s3_key'),
+                's3_url': s3_data.get('file_url'),
+                **parsed_content.get('metadata', {})
+            }
+            
             # 创建记忆单元
             memory_id = database_service.create_memory(
                 content=parsed_content['text'],
                 memory_type=parsed_content['type'],
                 embedding=embedding,
                 user_id=user_id,
-                metadata={
-                    'original_filename': file.filename,
-                    'file_size': len(file_content),
-                    'file_extension': file_extension,
-                    's3_key': s3_data.get('s3_key'),
-                    's3_url': s3_data.get('file_url'),
-                    **parsed_content.get('metadata', {})
-                },
+                metadata=base_metadata,
                 source=s3_data.get('file_url'),
                 summary=parsed_content.get('summary'),
-                tags=parsed_content.get('tags', [])
+                tags=parsed_content.get('tags', []),
+                content_hash=content_hash
             )
             # 处理额外的文本块（如果有的话）
             additional_memories = []
             if 'additional_chunks' in parsed_content:
+                total_chunks = parsed_content['metadata'].get('total_chunks', 1)
                 for i, chunk in enumerate(parsed_content['additional_chunks']):
                     try:
                         # 为每个块生成embedding
@@ -173,16 +238,12 @@ class ParserService:
                             memory_type=parsed_content['type'],
                             embedding=chunk_embedding,
                             user_id=user_id,  # ✅ 添加 user_id 参数
+                            # 块信息放在最后，不会被解析结果中的chunk_index覆盖
                             metadata={
-                                'original_filename': file.filename,
-                                'file_size': len(file_content),
-                                'file_extension': file_extension,
-                                's3_key': s3_data.get('s3_key'),
-                                's3_url': s3_data.get('file_url'),
+                                **base_metadata,
                                 'chunk_index': i + 1,
-                                'total_chunks': parsed_content['metadata'].get('total_chunks', 1),
-                                'is_partial': True,
-                                **parsed_content.get('metadata', {})
+                                'total_chunks': total_chunks,
+                                'is_partial': True
                             },
                             source=s3_data.get('file_url'),
                             summary=chunk[:200] + "..." if len(chunk) > 200 else chunk,
@@ -206,7 +267,8 @@ class ParserService:
                 'memory_id': memory_id,
                 'parsed_content': parsed_content,
                 'embedding_dimension': len(embedding),
-                'additional_memories': additional_memories
+                'additional_memories': additional_memories,
+                'deduplicated': False
             }
             
         except Exception as e:
@@ -216,42 +278,51 @@ class ParserService:
     async def _parse_pdf(self, content: bytes, file: UploadFile) -> Dict[str, Any]:
         """解析PDF文件"""
         try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
-            text = ""
+            import pypdfium2 as pdfium
             
-            # 首先尝试直接提取文本
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                page_text = page.extract_text()
-                text += page_text + "\n"
+            pdf = pdfium.PdfDocument(content)
+            page_count = len(pdf)
             
-            # 清理文本
-            text = text.strip()
+            # 首先尝试直接提取每页文本
+            page_texts = [pdf[i].get_textpage().get_text_range() or "" for i in range(page_count)]
             
-            # 如果文本为空或很短，尝试OCR
-            if not text or len(text) < 50:
-                print("📄 PDF文本为空，尝试OCR识别...")
+            # 只有没有文本层的页面（扫描页）才需要渲染和OCR
+            scanned_pages = [
+                i for i, page_text in enumerate(page_texts)
+                if len(page_text.strip()) < MIN_PAGE_TEXT_LENGTH
+            ]
+            ocr_error = None
+            
+            if scanned_pages:
+                print(f"📄 {len(scanned_pages)}/{len(page_texts)}页没有文本，尝试OCR识别...")
                 try:
-                    # 将PDF转换为图片
-                    images = convert_from_bytes(content)
-                    ocr_text = ""
+                    # 只将扫描页渲染为图片（PDFium不是线程安全的，渲染在当前线程完成）
+                    images = [pdf[i].render(scale=OCR_RENDER_DPI / 72).to_pil() for i in scanned_pages]
                     
-                    for i, image in enumerate(images):
-                        print(f"🔍 OCR处理第{i+1}页...")
-                        # 使用pytesseract进行OCR
-                        page_text = pytesseract.image_to_string(image, lang='chi_sim+eng')
-                        ocr_text += page_text + "\n"
+                    # 各页在OCR线程池中并行识别
+                    loop = asyncio.get_running_loop()
+                    ocr_texts = await asyncio.gather(
+                        *[loop.run_in_executor(_OCR_POOL, _ocr_page, image) for image in images]
+                    )
                     
-                    if ocr_text.strip():
-                        text = ocr_text.strip()
-                        print(f"✅ OCR成功，提取文本长度: {len(text)}")
-                    else:
-                        print("⚠️ OCR也未提取到文本")
+                    # 按页码位置合并OCR结果
+                    for i, ocr_text in zip(scanned_pages, ocr_texts):
+                        if ocr_text.strip():
+                            page_texts[i] = ocr_text
+                    print(f"✅ OCR完成，处理{len(scanned_pages)}页")
                         
-                except Exception as ocr_error:
-                    print(f"❌ OCR失败: {ocr_error}")
-                    # OCR失败时，返回提示信息而不是空文本
-                    text = f"[扫描版PDF - 需要OCR识别] 此PDF文件是扫描版，无法直接提取文本。请安装OCR依赖或使用可编辑的PDF文件。错误详情: {str(ocr_error)}"
+                except Exception as e:
+                    print(f"❌ OCR失败: {e}")
+                    ocr_error = e
+            
+            pdf.close()
+            
+            # 清理文本
+            text = "".join(page_text + "\n" for page_text in page_texts).strip()
+            
+            if ocr_error is not None and len(text) < 50:
+                # OCR失败且没有可用文本时，返回提示信息而不是空文本
+                text = f"[扫描版PDF - 需要OCR识别] 此PDF文件是扫描版，无法直接提取文本。请安装OCR依赖或使用可编辑的PDF文件。错误详情: {str(ocr_error)}"
             
             # 检查文本长度，如果太长则分块
             text_chunks = self._split_text_into_chunks(text)
@@ -262,8 +333,8 @@ class ParserService:
                     'text': text_chunks[0],
                     'type': 'document',
                     'metadata': {
-                        'page_count': len(pdf_reader.pages),
-                        'parser': 'PyPDF2+OCR' if len(text) > 50 else 'PyPDF2',
+                        'page_count': page_count,
+                        'parser': 'pypdfium2+OCR' if len(text) > 50 else 'pypdfium2',
                         'total_chunks': len(text_chunks),
                         'chunk_index': 0,
                         'is_partial': True
@@ -277,8 +348,8 @@ class ParserService:
                     'text': text,
                     'type': 'document',
                     'metadata': {
-                        'page_count': len(pdf_reader.pages),
-                        'parser': 'PyPDF2+OCR' if len(text) > 50 else 'PyPDF2'
+                        'page_count': page_count,
+                        'parser': 'pypdfium2+OCR' if len(text) > 50 else 'pypdfium2'
                     },
                     'summary': text[:200] + "..." if len(text) > 200 else text,
                     'tags': ['pdf', 'document']
@@ -290,6 +361,8 @@ class ParserService:
     async def _parse_docx(self, content: bytes, file: UploadFile) -> Dict[str, Any]:
         """解析DOCX文件"""
         try:
+            import docx
+            
             doc = docx.Document(io.BytesIO(content))
             text = ""
             
@@ -316,20 +389,14 @@ class ParserService:
     async def _parse_text(self, content: bytes, file: UploadFile) -> Dict[str, Any]:
         """解析文本文件"""
         try:
-            # 尝试不同的编码
-            encodings = ['utf-8', 'gbk', 'gb2312', 'latin-1']
-            text = ""
-            
-            for encoding in encodings:
+            # 绝大多数文件是UTF-8，严格解码一次即可；失败时依次尝试gbk（覆盖gb2312）和latin-1
+            for encoding in TEXT_ENCODINGS:
                 try:
                     text = content.decode(encoding)
                     break
                 except UnicodeDecodeError:
                     continue
             
-            if not text:
-                text = content.decode('utf-8', errors='ignore')
-            
             # 清理文本
             text = text.strip()
             
@@ -337,7 +404,7 @@ class ParserService:
                 'text': text,
                 'type': 'text',
                 'metadata': {
-                    'encoding': 'utf-8',
+                    'encoding': encoding,
                     'parser': 'builtin'
                 },
                 'summary': text[:200] + "..." if len(text) > 200 else text,
@@ -350,7 +417,9 @@ class ParserService:
     async def _parse_image(self, content: bytes, file: UploadFile) -> Dict[str, Any]:
         """解析图片文件"""
         try:
-            # 打开图片
+            from PIL import Image
+            
+            # 打开图片（Image.open只读取文件头，不解码像素数据）
             image = Image.open(io.BytesIO(content))
             
             # 获取图片信息
@@ -361,10 +430,8 @@ class ParserService:
             # 生成图片描述（这里简化处理，实际应该使用CLIP或OCR）
             image_description = f"Image: {width}x{height} pixels, format: {format_name}, mode: {mode}"
             
-            # 将图片转换为base64用于存储
-            img_buffer = io.BytesIO()
-            image.save(img_buffer, format=format_name)
-            img_base64 = base64.b64encode(img_buffer.getvalue()).decode()
+            # 直接对原始文件字节做base64，避免重新编码图片
+            img_base64 = base64.b64encode(content).decode()
             
             return {
                 'text': image_description,
@@ -387,6 +454,19 @@ class ParserService:
     async def parse_text_input(self, text: str, source: Optional[str], user_id: str) -> Dict[str, Any]:
         """解析纯文本输入并创建记忆"""
         try:
+            # 相同文本已经入库时直接返回已有记忆
+            content_hash = make_dedup_key('text', generate_content_hash(text))
+            existing = database_service.find_memory_by_hash(user_id, content_hash)
+            if existing:
+                print(f"♻️  Duplicate text content, reusing memory {existing['id']}")
+                return {
+                    'success': True,
+                    'memory_id': existing['id'],
+                    'content': text,
+                    'embedding_dimension': self._stored_embedding_dimension(existing['id']),
+                    'deduplicated': True
+                }
+            
             # 生成embedding
             embedding = embedding_service.generate_embedding(
                 text=text,
@@ -405,14 +485,16 @@ class ParserService:
                 },
                 source=source,             # 第6个参数（命名参数）
                 summary=text[:200] + "..." if len(text) > 200 else text,  # 第7个参数
-                tags=['text', 'direct_input']  # 第8个参数 - 你可以用 [] 或 ['text', 'direct_input']
+                tags=['text', 'direct_input'],  # 第8个参数 - 你可以用 [] 或 ['text', 'direct_input']
+                content_hash=content_hash
             )
             
             return {
                 'success': True,
                 'memory_id': memory_id,
                 'content': text,
-                'embedding_dimension': len(embedding)
+                'embedding_dimension': len(embedding),
+                'deduplicated': False
             }
             
         except Exception as e:
@@ -421,6 +503,52 @@ class ParserService:
             traceback.print_exc()
             raise HTTPException(status_code=500, detail=f"Text parsing failed: {str(e)}")
         
+    def find_duplicate_file(
+        self,
+        file_content: bytes,
+        user_id: str,
+        content_hash: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        按内容哈希查找用户已上传过的相同文件（只匹配文件记忆，不匹配粘贴的文本）
+        
+        Args:
+            content_hash: 已计算好的去重键 make_dedup_key('file', ...)，为空时现场计算
+        
+        Returns:
+            Optional[Dict]: 命中时返回与 parse_file 相同结构的结果（deduplicated=True，
+            并带上已有记忆的 source），未命中返回None
+        """
+        if content_hash is None:
+            content_hash = make_dedup_key('file', generate_content_hash(file_content))
+        existing = database_service.find_memory_by_hash(user_id, content_hash)
+        if not existing:
+            return None
+        
+        print(f"♻️  Duplicate file content, reusing memory {existing['id']}")
+        return {
+            'success': True,
+            'memory_id': existing['id'],
+            'parsed_content': {
+                'text': existing.get('content'),
+                'type': existing.get('memory_type'),
+                'metadata': existing.get('metadata', {}),
+                'summary': existing.get('summary'),
+                'tags': existing.get('tags', [])
+            },
+            'embedding_dimension': self._stored_embedding_dimension(existing['id']),
+            'additional_memories': [],
+            'source': existing.get('source'),
+            'deduplicated': True
+        }
+    
+    def _stored_embedding_dimension(self, memory_id: str) -> int:
+        """已有记忆的向量维度"""
+        vector_data = database_service.vector_store.get(memory_id)
+        if vector_data is None:
+            return settings.EMBEDDING_DIMENSION
+        return len(vector_data['embedding'])
+    
     def get_supported_types(self) -> List[str]:
         """获取支持的文件类型"""
         return list(self.supported_types.keys())
@@ -429,7 +557,7 @@ class ParserService:
         """健康检查"""
         try:
             # 检查依赖库
-            import PyPDF2
+            import pypdfium2
             import docx
             from PIL import Image
             
@@ -437,7 +565,7 @@ class ParserService:
                 'status': 'healthy',
                 'supported_types': self.get_supported_types(),
                 'dependencies': {
-                    'PyPDF2': 'available',
+                    'pypdfium2': 'available',
                     'python-docx': 'available',
                     'PIL': 'available'
                 }
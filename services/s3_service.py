@@ -1,4 +1,5 @@
 # S3服务
+import asyncio
 import boto3
 from fastapi import UploadFile, HTTPException
 from datetime import datetime
@@ -37,12 +38,13 @@ class S3Service:
             )
         return True
     
-    async def upload_file(self, file: UploadFile) -> dict:
+    async def upload_file(self, file: UploadFile, file_content: bytes = None) -> dict:
         """
         上传文件到S3
         
         Args:
             file: 上传的文件
+            file_content: 已读取的文件内容，为空时从file读取
             
         Returns:
             dict: 文件信息
@@ -59,13 +61,15 @@ class S3Service:
             print(f"📤 Starting upload: {original_filename}")
             
             # 读取文件内容
-            file_content = await file.read()
+            if file_content is None:
+                file_content = await file.read()
             file_size = len(file_content)
             
             print(f"📊 File size: {file_size / 1024:.2f} KB")
             
-            # 上传到S3
-            self.client.put_object(
+            # 上传到S3（在线程中执行，不阻塞事件循环）
+            await asyncio.to_thread(
+                self.client.put_object,
                 Bucket=self.bucket_name,
                 Key=s3_key,
                 Body=file_content,
@@ -9,5 +9,8 @@ __all__ = [
     'clean_text',
     'extract_keywords',
     'calculate_similarity',
+    'calculate_similarity_batch',
+    'calculate_similarity_precomputed',
+    'make_dedup_key',
     'format_date_range'
 ]
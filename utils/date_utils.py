@@ -1,21 +1,37 @@
 # 日期时间工具函数
+import sys
+import time
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional, Tuple
 import re
 
+# Python 3.11+ 的 fromisoformat 可直接解析 'Z' 后缀
+_FROMISO_HAS_Z = sys.version_info >= (3, 11)
+
+# 相对日期正则在模块加载时编译一次
+_REL_RE = re.compile(r'(\d+)\s*(days?|weeks?|months?)\s*ago')
+
+@lru_cache(maxsize=8192)
+def _parse_iso(timestamp: str) -> datetime:
+    """解析 ISO 时间戳（结果缓存，同一记忆反复评分时无需重复解析）"""
+    if not _FROMISO_HAS_Z:
+        timestamp = timestamp.replace('Z', '+00:00')
+    return datetime.fromisoformat(timestamp)
+
 def format_date_range(start_date: str, end_date: str) -> Tuple[Optional[str], Optional[str]]:
     """格式化日期范围"""
     try:
         # 解析开始日期
         if start_date:
-            start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+            start_dt = _parse_iso(start_date)
             start_date = start_dt.isoformat()
         else:
             start_date = None
         
         # 解析结束日期
         if end_date:
-            end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+            end_dt = _parse_iso(end_date)
             end_date = end_dt.isoformat()
         else:
             end_date = None
@@ -25,6 +41,36 @@ def format_date_range(start_date: str, end_date: str) -> Tuple[Optional[str], Op
     except ValueError:
         return None, None
 
+def _start_of_day(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _this_week_start(now: datetime) -> datetime:
+    return _start_of_day(now - timedelta(days=now.weekday()))
+
+def _last_week_start(now: datetime) -> datetime:
+    return _start_of_day(now - timedelta(days=now.weekday() + 7))
+
+def _yesterday_start(now: datetime) -> datetime:
+    return _start_of_day(now - timedelta(days=1))
+
+def _this_month_start(now: datetime) -> datetime:
+    return _start_of_day(now.replace(day=1))
+
+def _last_month_start(now: datetime) -> datetime:
+    if now.month == 1:
+        return _start_of_day(now.replace(year=now.year-1, month=12, day=1))
+    return _start_of_day(now.replace(month=now.month-1, day=1))
+
+# 固定相对日期短语（中英文）到起始时间计算函数的映射
+_EXACT_RELATIVE = {
+    'today': _start_of_day, '今天': _start_of_day,
+    'yesterday': _yesterday_start, '昨天': _yesterday_start,
+    'this week': _this_week_start, '本周': _this_week_start,
+    'last week': _last_week_start, '上周': _last_week_start,
+    'this month': _this_month_start, '本月': _this_month_start,
+    'last month': _last_month_start, '上月': _last_month_start,
+}
+
 def parse_relative_date(relative_str: str) -> Optional[datetime]:
     """解析相对日期字符串"""
     if not relative_str:
@@ -33,54 +79,22 @@ def parse_relative_date(relative_str: str) -> Optional[datetime]:
     now = datetime.utcnow()
     relative_str = relative_str.lower().strip()
     
-    # 今天
-    if relative_str in ['today', '今天']:
-        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    # 固定短语直接查表
+    handler = _EXACT_RELATIVE.get(relative_str)
+    if handler:
+        return handler(now)
     
-    # 昨天
-    if relative_str in ['yesterday', '昨天']:
-        return (now - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    # 本周
-    if relative_str in ['this week', '本周']:
-        days_since_monday = now.weekday()
-        return (now - timedelta(days=days_since_monday)).replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    # 上周
-    if relative_str in ['last week', '上周']:
-        days_since_monday = now.weekday()
-        last_monday = now - timedelta(days=days_since_monday + 7)
-        return last_monday.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    # 本月
-    if relative_str in ['this month', '本月']:
-        return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    
-    # 上月
-    if relative_str in ['last month', '上月']:
-        if now.month == 1:
-            return now.replace(year=now.year-1, month=12, day=1, hour=0, minute=0, second=0, microsecond=0)
-        else:
-            return now.replace(month=now.month-1, day=1, hour=0, minute=0, second=0, microsecond=0)
-    
-    # 解析 "N days ago" 格式
-    days_ago_match = re.search(r'(\d+)\s*days?\s*ago', relative_str)
-    if days_ago_match:
-        days = int(days_ago_match.group(1))
-        return now - timedelta(days=days)
-    
-    # 解析 "N weeks ago" 格式
-    weeks_ago_match = re.search(r'(\d+)\s*weeks?\s*ago', relative_str)
-    if weeks_ago_match:
-        weeks = int(weeks_ago_match.group(1))
-        return now - timedelta(weeks=weeks)
-    
-    # 解析 "N months ago" 格式
-    months_ago_match = re.search(r'(\d+)\s*months?\s*ago', relative_str)
-    if months_ago_match:
-        months = int(months_ago_match.group(1))
+    # 解析 "N days/weeks/months ago" 格式
+    match = _REL_RE.search(relative_str)
+    if match:
+        count = int(match.group(1))
+        unit = match.group(2)
+        if unit.startswith('day'):
+            return now - timedelta(days=count)
+        if unit.startswith('week'):
+            return now - timedelta(weeks=count)
         # 简化处理：按30天计算
-        return now - timedelta(days=months * 30)
+        return now - timedelta(days=count * 30)
     
     return None
 
@@ -100,19 +114,29 @@ def get_time_range_filters(
     # 否则使用提供的日期范围
     return format_date_range(start_date or "", end_date or "")
 
+@lru_cache(maxsize=4096)
 def format_timestamp_for_display(timestamp: str) -> str:
     """格式化时间戳用于显示"""
     try:
-        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        dt = _parse_iso(timestamp)
         return dt.strftime('%Y-%m-%d %H:%M:%S')
     except ValueError:
         return timestamp
 
-def get_relative_time_description(timestamp: str) -> str:
-    """获取相对时间描述"""
+def get_relative_time_description(timestamp: str, now: Optional[datetime] = None) -> str:
+    """获取相对时间描述（批量调用时可传入同一个 now 避免重复取时间）"""
+    if now is not None:
+        return _relative_description(timestamp, now)
+    return _cached_relative_description(timestamp, int(time.time() // 60))
+
+@lru_cache(maxsize=4096)
+def _cached_relative_description(timestamp: str, now_minute: int) -> str:
+    """按分钟分桶缓存相对时间描述，同一分钟内重复的时间戳直接命中"""
+    return _relative_description(timestamp, datetime.utcnow())
+
+def _relative_description(timestamp: str, now: datetime) -> str:
     try:
-        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-        now = datetime.utcnow()
+        dt = _parse_iso(timestamp)
         diff = now - dt
         
         if diff.days > 0:
@@ -148,15 +172,15 @@ def is_within_time_range(
 ) -> bool:
     """检查时间戳是否在指定范围内"""
     try:
-        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        dt = _parse_iso(timestamp)
         
         if start_date:
-            start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+            start_dt = _parse_iso(start_date)
             if dt < start_dt:
                 return False
         
         if end_date:
-            end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+            end_dt = _parse_iso(end_date)
             if dt > end_dt:
                 return False
         
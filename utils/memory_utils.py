@@ -1,17 +1,44 @@
 # 记忆相关工具函数
 import uuid
+import math
 import hashlib
+from functools import lru_cache
+from itertools import chain
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
 import numpy as np
 
 def generate_memory_id() -> str:
     """生成唯一的记忆ID"""
     return str(uuid.uuid4())
 
-def generate_content_hash(content: str) -> str:
-    """生成内容哈希值用于去重"""
-    return hashlib.md5(content.encode('utf-8')).hexdigest()
+# 只缓存短文本的哈希；文件字节和长文本不进入缓存，避免缓存键长期占用内存
+CONTENT_HASH_CACHE_MAX_LEN = 1024
+
+def _sha256_hex(content: Union[str, bytes]) -> str:
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+_cached_sha256_hex = lru_cache(maxsize=4096)(_sha256_hex)
+
+def generate_content_hash(content: Union[str, bytes]) -> str:
+    """
+    生成内容哈希值用于去重（SHA-256，短文本带缓存）
+    
+    与记忆表 content_hash_index 中存储的哈希一致：文本按UTF-8编码，文件按原始字节。
+    """
+    if isinstance(content, str) and len(content) < CONTENT_HASH_CACHE_MAX_LEN:
+        return _cached_sha256_hex(content)
+    return _sha256_hex(content)
+
+def make_dedup_key(kind: str, content_hash: str) -> str:
+    """
+    去重索引中存储的键：内容类型前缀 + 哈希
+    
+    文件（'file'）与粘贴文本（'text'）使用不同前缀，相同字节的文本和文件不会互相判重。
+    """
+    return f"{kind}:{content_hash}"
 
 def format_timestamp(timestamp: datetime = None) -> str:
     """格式化时间戳"""
@@ -19,17 +46,60 @@ def format_timestamp(timestamp: datetime = None) -> str:
         timestamp = datetime.utcnow()
     return timestamp.isoformat()
 
-def calculate_similarity(embedding1: List[float], embedding2: List[float]) -> float:
+def calculate_similarity(
+    embedding1: Union[List[float], np.ndarray],
+    embedding2: Union[List[float], np.ndarray]
+) -> float:
     """计算两个向量的余弦相似度"""
-    vec1 = np.array(embedding1)
-    vec2 = np.array(embedding2)
+    # ndarray直接使用，列表只转换一次
+    vec1 = np.asarray(embedding1, dtype=np.float32)
+    vec2 = np.asarray(embedding2, dtype=np.float32)
+    
+    # 点积和两个范数的平方各一次BLAS调用
+    denominator = math.sqrt(float(vec1 @ vec1) * float(vec2 @ vec2))
+    if denominator == 0:
+        return 0.0
     
-    # 计算余弦相似度
-    similarity = np.dot(vec1, vec2) / (
-        np.linalg.norm(vec1) * np.linalg.norm(vec2)
-    )
+    return float(vec1 @ vec2) / denominator
+
+def calculate_similarity_precomputed(
+    embedding1: np.ndarray,
+    norm1: float,
+    embedding2: np.ndarray,
+    norm2: float
+) -> float:
+    """使用预先计算的范数计算余弦相似度"""
+    denominator = norm1 * norm2
+    if denominator == 0:
+        return 0.0
+    return float(np.dot(embedding1, embedding2) / denominator)
+
+def calculate_similarity_batch(
+    query: Union[List[float], np.ndarray],
+    matrix: np.ndarray,
+    norms: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    计算查询向量与矩阵每一行的余弦相似度
+    
+    Args:
+        query: 查询向量，形状 (d,)
+        matrix: 候选向量矩阵，形状 (n, d)
+        norms: 预先计算的每行范数，形状 (n,)；为空时现场计算
+        
+    Returns:
+        np.ndarray: 相似度，形状 (n,)；零向量的相似度为0
+    """
+    query_vec = np.asarray(query, dtype=np.float32)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if norms is None:
+        norms = np.linalg.norm(matrix, axis=1)
+    
+    # 一次矩阵-向量乘法（GEMV）代替逐对计算
+    with np.errstate(divide='ignore', invalid='ignore'):
+        similarities = (matrix @ query_vec) / (norms * np.linalg.norm(query_vec))
     
-    return float(similarity)
+    return np.nan_to_num(similarities, nan=0.0, posinf=0.0, neginf=0.0)
 
 def create_memory_metadata(
     content: str,
@@ -39,16 +109,20 @@ def create_memory_metadata(
     **kwargs
 ) -> Dict[str, Any]:
     """创建记忆元数据"""
+    now = format_timestamp()
     return {
         'content_hash': generate_content_hash(content),
         'memory_type': memory_type,
         'source': source,
         'tags': tags or [],
-        'created_at': format_timestamp(),
-        'updated_at': format_timestamp(),
+        'created_at': now,
+        'updated_at': now,
         **kwargs
     }
 
+# 精确类型集合查找比 isinstance 的 MRO 检查更快，未命中时再回退到 isinstance
+_NUMERIC_TYPES = frozenset((int, float))
+
 def validate_memory_data(data: Dict[str, Any]) -> bool:
     """验证记忆数据格式"""
     required_fields = ['content', 'memory_type', 'embedding']
@@ -57,9 +131,15 @@ def validate_memory_data(data: Dict[str, Any]) -> bool:
         if field not in data:
             return False
     
+    embedding = data['embedding']
+    
+    # ndarray 直接检查 dtype，无需逐元素遍历
+    if isinstance(embedding, np.ndarray):
+        return embedding.ndim == 1 and embedding.dtype.kind in 'fiu'
+    
     # 验证embedding是数字列表
-    if not isinstance(data['embedding'], list) or not all(
-        isinstance(x, (int, float)) for x in data['embedding']
+    if not isinstance(embedding, list) or not all(
+        type(x) in _NUMERIC_TYPES or isinstance(x, (int, float)) for x in embedding
     ):
         return False
     
@@ -75,8 +155,8 @@ def merge_memory_metadata(
     # 更新字段
     for key, value in new.items():
         if key == 'tags' and key in merged:
-            # 合并标签
-            merged[key] = list(set(merged[key] + value))
+            # 合并标签（保持原有顺序去重，不拼接临时列表）
+            merged[key] = list(dict.fromkeys(chain(merged[key], value)))
         elif key == 'updated_at':
             # 总是更新修改时间
             merged[key] = value
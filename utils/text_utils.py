@@ -1,19 +1,54 @@
 # 文本处理工具函数
 import re
 import string
-from typing import List, Dict, Any
+from typing import List, Dict, Any, FrozenSet
 from collections import Counter
+from functools import lru_cache
+
+# 正则和转换表在模块加载时构建一次
+_WHITESPACE_RE = re.compile(r'\s+')
+_STRIP_RE = re.compile(r'[^\w\s.,!?;:()\-]')
+# 实体提取：四类模式合并为一个带命名分组的交替正则，一次扫描完成
+_ENTITY_RE = re.compile(
+    r'(?P<urls>http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+)'
+    r'|(?P<emails>\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b)'
+    r'|(?P<phone_numbers>\b\d{3}[-.]?\d{3}[-.]?\d{4}\b)'
+    r'|(?P<dates>\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b)'
+)
+_MULTI_SPACE_RE = re.compile(r' {2,}')
+_PUNCT_TABLE = str.maketrans('', '', string.punctuation)
+
+# clean_text 的 ASCII 快速路径：空白映射为空格，不允许的字符删除，与 _STRIP_RE 判定一致
+_CLEAN_TABLE = {
+    c: (' ' if chr(c).isspace() else None)
+    for c in range(128)
+    if chr(c).isspace() or _STRIP_RE.match(chr(c))
+}
+
+# 停用词（简化版）
+STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
+    'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
+    'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
+    'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these',
+    'those', 'i', 'you', 'he', 'she', 'it', 'we', 'they', 'me', 'him',
+    'her', 'us', 'them', 'my', 'your', 'his', 'her', 'its', 'our', 'their'
+})
 
 def clean_text(text: str) -> str:
     """清理文本内容"""
     if not text:
         return ""
     
-    # 移除多余的空白字符
-    text = re.sub(r'\s+', ' ', text)
-    
-    # 移除特殊字符但保留基本标点
-    text = re.sub(r'[^\w\s.,!?;:()\-]', '', text)
+    if text.isascii():
+        # 一次 translate 完成空白归一和特殊字符移除，仅在存在连续空格时再折叠
+        text = text.translate(_CLEAN_TABLE)
+        if '  ' in text:
+            text = _MULTI_SPACE_RE.sub(' ', text)
+    else:
+        # 非 ASCII 文本（如中文）需要 Unicode 语义的 \w 判定
+        text = _STRIP_RE.sub('', text)
+        text = _WHITESPACE_RE.sub(' ', text)
     
     # 去除首尾空白
     text = text.strip()
@@ -25,33 +60,11 @@ def extract_keywords(text: str, max_keywords: int = 10) -> List[str]:
     if not text:
         return []
     
-    # 转换为小写
-    text = text.lower()
-    
-    # 移除标点符号
-    text = text.translate(str.maketrans('', '', string.punctuation))
-    
-    # 分割单词
-    words = text.split()
-    
-    # 过滤停用词（简化版）
-    stop_words = {
-        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
-        'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
-        'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
-        'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these',
-        'those', 'i', 'you', 'he', 'she', 'it', 'we', 'they', 'me', 'him',
-        'her', 'us', 'them', 'my', 'your', 'his', 'her', 'its', 'our', 'their'
-    }
-    
-    # 过滤单词
-    filtered_words = [
-        word for word in words 
-        if len(word) > 2 and word not in stop_words
-    ]
-    
-    # 计算词频
-    word_counts = Counter(filtered_words)
+    # 小写、去标点、分词后直接过滤停用词并计数，不生成中间列表
+    word_counts = Counter(
+        word for word in text.lower().translate(_PUNCT_TABLE).split()
+        if len(word) > 2 and word not in STOP_WORDS
+    )
     
     # 返回最常见的词
     return [word for word, count in word_counts.most_common(max_keywords)]
@@ -72,9 +85,9 @@ def generate_summary(text: str, max_length: int = 200) -> str:
     summary = cleaned_text[:max_length].rstrip()
     
     # 确保不在单词中间截断
-    last_space = summary.rfind(' ')
-    if last_space > max_length * 0.8:  # 如果最后一个空格位置合理
-        summary = summary[:last_space]
+    head, sep, _ = summary.rpartition(' ')
+    if sep and len(head) > max_length * 0.8:  # 如果最后一个空格位置合理
+        summary = head
     
     return summary + "..."
 
@@ -87,40 +100,28 @@ def extract_entities(text: str) -> Dict[str, List[str]]:
         'dates': []
     }
     
-    # 提取邮箱
-    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-    entities['emails'] = re.findall(email_pattern, text)
-    
-    # 提取URL
-    url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-    entities['urls'] = re.findall(url_pattern, text)
-    
-    # 提取电话号码（简化版）
-    phone_pattern = r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b'
-    entities['phone_numbers'] = re.findall(phone_pattern, text)
-    
-    # 提取日期（简化版）
-    date_pattern = r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b'
-    entities['dates'] = re.findall(date_pattern, text)
+    # 一次扫描提取邮箱、URL、电话号码、日期（简化版），按命名分组归类
+    for match in _ENTITY_RE.finditer(text):
+        entities[match.lastgroup].append(match.group())
     
     return entities
 
+@lru_cache(maxsize=1024)
+def _tokens(text: str) -> FrozenSet[str]:
+    """清理并分词（缓存，同一查询与多个候选比较时只处理一次）"""
+    return frozenset(clean_text(text).lower().split())
+
 def calculate_text_similarity(text1: str, text2: str) -> float:
     """计算两个文本的相似度（基于词汇重叠）"""
     if not text1 or not text2:
         return 0.0
     
-    # 清理文本
-    clean_text1 = clean_text(text1).lower()
-    clean_text2 = clean_text(text2).lower()
-    
-    # 分割为单词
-    words1 = set(clean_text1.split())
-    words2 = set(clean_text2.split())
+    words1 = _tokens(text1)
+    words2 = _tokens(text2)
     
-    # 计算Jaccard相似度
-    intersection = len(words1.intersection(words2))
-    union = len(words1.union(words2))
+    # 计算Jaccard相似度：|A∩B| / (|A|+|B|-|A∩B|)，只需一次集合遍历
+    intersection = len(words1 & words2)
+    union = len(words1) + len(words2) - intersection
     
     if union == 0:
         return 0.0